@@ -0,0 +1,305 @@
+"""
+Command line interface for categories. See README.md or `python3 categories --help` for help.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import urllib.parse
+import shutil
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, TypeVar
+
+import requests
+
+
+DEFAULT_DEST = pathlib.Path(__file__).parent.parent.joinpath("pages")
+DEFAULT_CACHE_DIR = pathlib.Path(__file__).parent.parent.joinpath("data_cache")
+GH_PAGES_URL = os.environ.get("GH_PAGES_URL", "")
+PROBE_CACHE_PATH = pathlib.Path.home().joinpath(
+    ".cache", "wiki-categories", "probes.json"
+)
+PROBE_CACHE_TTL = 3600
+
+# Shared by every request of a run so connections are kept alive between them.
+SESSION = requests.Session()
+SESSION.headers["Accept-Encoding"] = "identity"
+
+_T = TypeVar("_T")
+
+
+def _load_probe_cache() -> Dict[str, Dict[str, Any]]:
+    """
+    Load the probe results of recent runs that haven't expired.
+    """
+
+    try:
+        with PROBE_CACHE_PATH.open() as f_cache:
+            probe_cache = json.load(f_cache)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    now = time.time()
+
+    return {
+        k: v for k, v in probe_cache.items() if now - v["fetchedAt"] < PROBE_CACHE_TTL
+    }
+
+
+def _save_probe_cache(probe_cache: Dict[str, Dict[str, Any]]):
+    os.makedirs(PROBE_CACHE_PATH.parent, exist_ok=True)
+
+    with PROBE_CACHE_PATH.open("w") as f_cache:
+        json.dump(probe_cache, f_cache)
+
+
+def _cached_probe(
+    probe_cache: Dict[str, Dict[str, Any]], url: str, probe: Callable[[str], _T]
+) -> _T:
+    """
+    Get the result of probe(url) from probe_cache, probing and storing the
+    result if it isn't cached. The result must be JSON-serializable.
+    """
+
+    key = hashlib.sha1(f"{probe.__name__}:{url}".encode()).hexdigest()
+
+    if key not in probe_cache:
+        probe_cache[key] = {"value": probe(url), "fetchedAt": time.time()}
+
+    return probe_cache[key]["value"]
+
+
+def _get_asset_info(url: str) -> Dict[str, Optional[str]]:
+    """
+    Get the response headers that identify a version of a remote asset, keyed
+    by the suffix of their name in `run_info.json`.
+    """
+
+    headers = SESSION.head(url, timeout=10).headers
+
+    return {
+        "Modified": headers.get("Last-Modified", None),
+        "ETag": headers.get("ETag", None),
+        "Length": headers.get("Content-Length", None),
+    }
+
+
+def _get_json(url: str) -> Any:
+    return SESSION.get(url, timeout=10).json()
+
+
+def _run_info_fields(
+    category_links_info: Dict[str, Optional[str]],
+    pages_info: Dict[str, Optional[str]],
+) -> Dict[str, Optional[str]]:
+    return {
+        **{f"categoryLinks{k}": v for k, v in category_links_info.items()},
+        **{f"pages{k}": v for k, v in pages_info.items()},
+    }
+
+
+def _is_redundant(
+    run_info_url: str,
+    _category_links_info: Dict[str, Optional[str]],
+    _pages_info: Dict[str, Optional[str]],
+    probe_cache: Dict[str, Dict[str, Any]],
+) -> bool:
+    """
+    Check if current run is redundant to the last run.
+
+    The run is redundant if all assets used in the current and most recent run
+    have the same 'Last-Modified', 'ETag' and 'Content-Length' response
+    headers.
+    """
+
+    if _category_links_info["Modified"] is None or _pages_info["Modified"] is None:
+        return False
+
+    try:
+        run_info_json = _cached_probe(probe_cache, run_info_url, _get_json)
+    except requests.exceptions.JSONDecodeError:
+        return False
+
+    return all(
+        k in run_info_json and run_info_json[k] == v
+        for k, v in _run_info_fields(_category_links_info, _pages_info).items()
+    )
+
+
+def _is_cached(cache_path: pathlib.Path, last_modified: Optional[str]) -> bool:
+    """
+    Check if the cached copy of a data dump is up to date.
+
+    The cached copy is up to date if its modification time matches the
+    'Last-Modified' response header of the remote asset.
+    """
+
+    if last_modified is None or not cache_path.exists():
+        return False
+
+    return (
+        cache_path.stat().st_mtime == parsedate_to_datetime(last_modified).timestamp()
+    )
+
+
+def main():
+    """
+    Parse arguments and run categories. Modules that are slow to import are
+    only imported once the run is known to be necessary.
+    """
+
+    parser = argparse.ArgumentParser(
+        "categories", description="Collect category information and output to folder."
+    )
+
+    parser.add_argument("language", help="The wiki language to collect categories for.")
+
+    parser.add_argument(
+        "--dest",
+        help="The output folder for category information. Must be empty.",
+        type=pathlib.Path,
+        default=DEFAULT_DEST,
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        help="The folder that downloaded data dumps are cached in.",
+        type=pathlib.Path,
+        default=DEFAULT_CACHE_DIR,
+    )
+
+    parser.add_argument(
+        "--excluded-parents",
+        help="Ids of categories to exclude children from.",
+        type=int,
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "--excluded-article-categories",
+        help="Ids of categories to exclude articles from.",
+        type=int,
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "--debug", help="Show progress and debug information.", action="store_true"
+    )
+
+    parser.add_argument(
+        "--clean",
+        help="Clean output folder before starting if the folder isn't empty.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--no-indices",
+        help="Do not generate index.html in each folder.",
+        action="store_true",
+    )
+
+    args = parser.parse_args()
+
+    lang: str = args.language
+    dest: pathlib.Path = args.dest
+    cache_dir: pathlib.Path = args.cache_dir
+    debug: bool = args.debug
+    clean: bool = args.clean
+    no_indices: bool = args.no_indices
+
+    if debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    else:
+        logging.getLogger().setLevel(logging.INFO)
+
+    excluded_parents = args.excluded_parents
+    excluded_article_categories = args.excluded_article_categories
+
+    category_links_url = (
+        f"https://dumps.wikimedia.org/{lang}wiki/"
+        f"latest/{lang}wiki-latest-categorylinks.sql.gz"
+    )
+    pages_url = (
+        f"https://dumps.wikimedia.org/{lang}wiki/latest/{lang}wiki-latest-page.sql.gz"
+    )
+
+    probe_cache = _load_probe_cache()
+
+    # The probes are independent, so their round trips are made concurrently.
+    with ThreadPoolExecutor(2) as executor:
+        category_links_info, pages_info = executor.map(
+            functools.partial(_cached_probe, probe_cache, probe=_get_asset_info),
+            (category_links_url, pages_url),
+        )
+
+    is_redundant = bool(GH_PAGES_URL) and _is_redundant(
+        urllib.parse.urljoin(GH_PAGES_URL, "run_info.json"),
+        category_links_info,
+        pages_info,
+        probe_cache,
+    )
+
+    _save_probe_cache(probe_cache)
+
+    if is_redundant:
+        logging.info(
+            "Run is redundant, all Wiki data dump assets are up to date. Exiting."
+        )
+        sys.exit(0)
+
+    if clean and dest.exists():
+        shutil.rmtree(dest)
+
+    os.makedirs(dest, exist_ok=True)
+    assert clean or not os.listdir(dest), f"The output folder {dest} is not empty."
+
+    from gzip_buffer import read_buffered_gzip_local, read_buffered_gzip_remote
+    from html_indices import generate_indices
+    from parse import parse_category_links, parse_pages, parse_parallel
+    from process_categories import process_categories
+
+    def _read_dump(url: str, modified: Optional[str]) -> Iterable[bytes]:
+        cache_path = cache_dir.joinpath(url.rsplit("/", 1)[-1])
+
+        if _is_cached(cache_path, modified):
+            return read_buffered_gzip_local(cache_path, progress=debug)
+
+        return read_buffered_gzip_remote(url, progress=debug, cache_path=cache_path)
+
+    def _gen_category_links():
+        return parse_parallel(
+            _read_dump(category_links_url, category_links_info["Modified"]),
+            parse_category_links,
+        )
+
+    def _gen_pages():
+        return parse_parallel(
+            _read_dump(pages_url, pages_info["Modified"]), parse_pages
+        )
+
+    categories_info = process_categories(
+        dest,
+        _gen_category_links,
+        _gen_pages,
+        excluded_parents=excluded_parents,
+        excluded_article_categories=excluded_article_categories,
+        progress=debug,
+    )
+
+    run_info = {
+        **_run_info_fields(category_links_info, pages_info),
+        **categories_info.to_json(),
+    }
+
+    with dest.joinpath("run_info.json").open("w") as f_info:
+        json.dump(run_info, f_info, indent=1)
+
+    if not no_indices:
+        generate_indices(dest)
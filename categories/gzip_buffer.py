@@ -2,63 +2,409 @@
 Contains utilities to iterate over a remote or local gzip-compressed file.
 """
 
+from email.utils import parsedate_to_datetime
+import http.client
+import logging
+import os
 import pathlib
-from typing import Iterable
-import zlib
+import queue
+import threading
+import time
+from typing import BinaryIO, Callable, Iterable, Optional
+import urllib.error
+import urllib.request
 
-import requests
 from tqdm import tqdm
 
+try:
+    # python-isal is an optional, considerably faster drop-in for zlib.
+    from isal import isal_zlib as zlib
+    from isal.igzip import IGzipFile as GzipFile
+except ImportError:
+    import zlib
+    from gzip import GzipFile
+
+try:
+    # rapidgzip is optional and decompresses local files in parallel.
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+
+# Reads much below 64 KiB spend more time in Python per byte than in the socket
+# or the decompressor, so chunk_size should stay in the hundreds of KiB.
+_CHUNK_SIZE = 262_144
+_READ_BUFFER_SIZE = 1 << 20
+_PREFETCH_CHUNKS = 32
+_PROGRESS_BYTES = 1 << 20
+_MAX_DECOMPRESSED_CHUNK = 1 << 20
+_DOWNLOAD_RETRIES = 5
+
+# Server errors that are likely transient, and are retried like dropped
+# connections.
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# The assets are already gzipped, and Content-Length should describe them as is.
+_REQUEST_HEADERS = {"Accept-Encoding": "identity"}
+
+
+def _gzip_decompressobj():
+    return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+
+def _decompress(
+    chunks: Iterable[bytes], dc_obj, p_bar: Optional[tqdm]
+) -> Iterable[bytes]:
+    decompress = dc_obj.decompress
+    pending = 0
+
+    for chunk in chunks:
+        # Highly compressed chunks are inflated in bounded pieces, so no
+        # single piece grows far beyond what consumers handle comfortably.
+        data = decompress(chunk, _MAX_DECOMPRESSED_CHUNK)
+        yield data
+        while len(data) == _MAX_DECOMPRESSED_CHUNK:
+            data = decompress(dc_obj.unconsumed_tail, _MAX_DECOMPRESSED_CHUNK)
+            yield data
+
+        if p_bar is not None:
+            # Updating the progress bar per chunk is costly, so updates are
+            # batched.
+            pending += len(chunk)
+            if pending >= _PROGRESS_BYTES:
+                p_bar.update(pending)
+                pending = 0
+
+    if p_bar is not None and pending:
+        p_bar.update(pending)
+
+
+def _tee(chunks: Iterable[bytes], f: BinaryIO) -> Iterable[bytes]:
+    for chunk in chunks:
+        f.write(chunk)
+        yield chunk
+
+
+def _advise_sequential(f: BinaryIO):
+    try:
+        # Hint the kernel to read ahead aggressively, and that pages behind
+        # the cursor won't be needed again.
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_NOREUSE)
+    except AttributeError:
+        # Not available on every platform.
+        pass
+
+
+def _read_chunks(f: BinaryIO, chunk_size: int) -> Iterable[bytes]:
+    while chunk := f.read(chunk_size):
+        yield chunk
+
+
+def _prefetch(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """
+    Iterate over chunks in a background thread, so that producing them (e.g.
+    waiting on the network) overlaps with the work of the consumer.
+    """
+
+    chunk_queue: queue.Queue = queue.Queue(maxsize=_PREFETCH_CHUNKS)
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stopped.is_set():
+                    return
+                chunk_queue.put(chunk)
+        except Exception as e:
+            chunk_queue.put(e)
+        else:
+            chunk_queue.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    try:
+        while (chunk := chunk_queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # Unblock the producer if the consumer stopped early.
+        stopped.set()
+        while not chunk_queue.empty():
+            chunk_queue.get_nowait()
+
+
+def _open(
+    url: str, position: int = 0, validator: Optional[str] = None
+) -> http.client.HTTPResponse:
+    headers = dict(_REQUEST_HEADERS)
+    if position:
+        headers["Range"] = f"bytes={position}-"
+        if validator is not None:
+            # The server answers with the whole asset instead, if it changed.
+            headers["If-Range"] = validator
+
+    return urllib.request.urlopen(
+        urllib.request.Request(url, headers=headers), timeout=10
+    )
+
+
+def _validator(response: http.client.HTTPResponse) -> Optional[str]:
+    """
+    Get the header value identifying the version of the asset in the response,
+    in the form accepted by If-Range.
+    """
+
+    etag = response.headers.get("ETag", None)
+    # Weak entity tags can't be used with If-Range.
+    if etag is not None and not etag.startswith("W/"):
+        return etag
+
+    return response.headers.get("Last-Modified", None)
+
+
+def _is_resumed(response: http.client.HTTPResponse, position: int) -> bool:
+    content_range = response.headers.get("Content-Range", "")
+    # e.g. 'bytes 1000-1999/2000'
+    unit, _, byte_range = content_range.partition(" ")
+    start = byte_range.partition("-")[0]
+
+    return (
+        response.status == 206
+        and unit == "bytes"
+        and start.isdigit()
+        and int(start) == position
+    )
+
+
+def _iter_response_resuming(
+    url: str,
+    response: Optional[http.client.HTTPResponse],
+    chunk_size: int,
+    position: int,
+    validator: Optional[str] = None,
+) -> Iterable[bytes]:
+    """
+    Iterate over the body of a response, starting at position of the remote
+    asset. If the connection drops, the download is resumed with a Range
+    request after an exponential backoff. The Range request is conditional on
+    validator, so the asset changing in between is an error.
+    """
+
+    retries = 0
+
+    while True:
+        try:
+            if response is None:
+                response = _open(url, position, validator)
+                # No Range header is sent before the first byte arrived.
+                if not (
+                    _is_resumed(response, position)
+                    if position
+                    else response.status == 200
+                ):
+                    raise urllib.error.HTTPError(
+                        url,
+                        response.status,
+                        "Can't resume download",
+                        response.headers,
+                        None,
+                    )
+
+            read = response.read
+            while chunk := read(chunk_size):
+                position += len(chunk)
+                retries = 0
+                yield chunk
+
+            # http.client doesn't raise if the body ends before Content-Length.
+            if response.length:
+                raise http.client.IncompleteRead(b"", response.length)
+
+            return
+        except (OSError, http.client.HTTPException) as e:
+            if retries == _DOWNLOAD_RETRIES or (
+                isinstance(e, urllib.error.HTTPError) and e.code not in _RETRY_STATUSES
+            ):
+                raise
+
+            logging.warning(
+                "Download of %s interrupted, resuming in %d seconds.",
+                url,
+                2**retries,
+            )
+            time.sleep(2**retries)
+            retries += 1
+            if response is not None:
+                response.close()
+            response = None
+
 
 def read_buffered_gzip_remote(
-    url: str, chunk_size: int = 1024, progress: bool = True
+    url: str,
+    chunk_size: int = _CHUNK_SIZE,
+    progress: bool = True,
+    cache_path: Optional[pathlib.Path] = None,
 ) -> Iterable[bytes]:
     """
-    Read chunks of a gzipped remote asset by url.
+    Read chunks of a gzipped remote asset by url. Dropped connections are
+    resumed.
+
+    If cache_path is given, the compressed asset is also written to it, with
+    its modification time set to the asset's 'Last-Modified' response header.
+    An incomplete download is kept with a '.part' suffix and resumed by the
+    next call, unless the asset changed in between. The 'ETag' or
+    'Last-Modified' header identifying its version is kept next to it, with a
+    '.part.validator' suffix.
     """
 
-    response = requests.get(url, stream=True, timeout=10)
+    part_path = None
+    validator_path = None
+    validator = None
+    resume_from = 0
+
+    if cache_path is not None:
+        part_path = cache_path.with_name(cache_path.name + ".part")
+        validator_path = cache_path.with_name(cache_path.name + ".part.validator")
+        # Without a validator, a partial download can't safely be resumed.
+        if part_path.exists() and validator_path.exists():
+            resume_from = part_path.stat().st_size
+            validator = validator_path.read_text()
+
+    response = None
 
-    stream = response.iter_content(chunk_size=chunk_size)
-    dc_obj = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    if resume_from:
+        try:
+            response = _open(url, resume_from, validator)
+        except urllib.error.HTTPError as e:
+            # 416 means the partial download is no shorter than the asset.
+            if e.code != 416:
+                raise
+        else:
+            # A whole asset in response means it changed since the partial
+            # download, or the server ignored the Range header. Either way,
+            # the download starts over with this response.
+            if not _is_resumed(response, resume_from) and response.status != 200:
+                response.close()
+                response = None
 
-    stream_len = int(response.headers.get("Content-Length", -1))
+        if response is None or response.status == 200:
+            resume_from = 0
+
+    if response is None:
+        response = _open(url)
+
+    if not resume_from:
+        validator = _validator(response)
+
+    stream = _iter_response_resuming(url, response, chunk_size, resume_from, validator)
+    dc_obj = _gzip_decompressobj()
+
+    # Content-Length is absent if the response uses chunked transfer encoding.
+    stream_len = int(response.headers.get("Content-Length") or 0)
 
     p_bar = None
 
-    if stream_len != -1 and progress:
-        p_bar = tqdm(total=stream_len, unit="B", unit_scale=True, unit_divisor=1024)
+    if progress:
+        p_bar = tqdm(
+            total=resume_from + stream_len if stream_len else None,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            mininterval=0.5,
+        )
 
-    for chunk in stream:
-        yield dc_obj.decompress(chunk)
-        if p_bar is not None:
-            p_bar.update(len(chunk))
+    if part_path is None:
+        yield from _decompress(_prefetch(stream), dc_obj, p_bar)
+    else:
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+
+        if not resume_from:
+            if validator is not None:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+
+        try:
+            if resume_from:
+                with part_path.open("rb") as f:
+                    _advise_sequential(f)
+                    yield from _decompress(_read_chunks(f, chunk_size), dc_obj, p_bar)
+
+            with part_path.open("ab" if resume_from else "wb") as f:
+                yield from _decompress(_prefetch(_tee(stream, f)), dc_obj, p_bar)
+        except zlib.error:
+            # The partial download is corrupt or belongs to an older version
+            # of the asset, so the next call should start over.
+            part_path.unlink()
+            validator_path.unlink(missing_ok=True)
+            raise
+
+        if dc_obj.eof:
+            os.replace(part_path, cache_path)
+            validator_path.unlink(missing_ok=True)
+
+            last_modified = response.headers.get("Last-Modified", None)
+            if last_modified is not None:
+                mtime = parsedate_to_datetime(last_modified).timestamp()
+                os.utime(cache_path, (mtime, mtime))
 
     if p_bar is not None:
         p_bar.close()
 
 
+def _read_decompressed(
+    gz_f: BinaryIO,
+    chunk_size: int,
+    p_bar: Optional[tqdm],
+    compressed_pos: Callable[[], int],
+) -> Iterable[bytes]:
+    reported_pos = 0
+
+    while chunk := gz_f.read(chunk_size):
+        yield chunk
+        if p_bar is not None:
+            new_pos = compressed_pos()
+            if new_pos - reported_pos >= _PROGRESS_BYTES:
+                p_bar.update(new_pos - reported_pos)
+                reported_pos = new_pos
+
+    if p_bar is not None:
+        p_bar.update(compressed_pos() - reported_pos)
+
+
 def read_buffered_gzip_local(
-    path: pathlib.Path, chunk_size: int = 1024, progress: bool = True
+    path: pathlib.Path, chunk_size: int = _CHUNK_SIZE, progress: bool = True
 ) -> Iterable[bytes]:
     """
-    Read chunks of a gzipped local asset by path.
+    Read chunks of a gzipped local asset by path. Decompression is done in
+    parallel if rapidgzip is installed.
     """
 
-    dc_obj = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    with open(path, "rb", buffering=_READ_BUFFER_SIZE) as f:
+        _advise_sequential(f)
 
-    p_bar = None
+        p_bar = None
 
-    if progress:
-        p_bar = tqdm(
-            total=path.lstat().st_size, unit="B", unit_scale=True, unit_divisor=1024
-        )
+        if progress:
+            p_bar = tqdm(
+                total=os.fstat(f.fileno()).st_size,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                mininterval=0.5,
+            )
 
-    with path.open("rb") as f:
-        while chunk := f.read(chunk_size):
-            yield dc_obj.decompress(chunk)
-            if p_bar is not None:
-                p_bar.update(len(chunk))
+        if rapidgzip is not None:
+            with rapidgzip.open(f, parallelization=os.cpu_count()) as gz_f:
+                # The compressed position is reported in bits.
+                yield from _read_decompressed(
+                    gz_f, chunk_size, p_bar, lambda: gz_f.tell_compressed() // 8
+                )
+        else:
+            with GzipFile(fileobj=f, mode="rb") as gz_f:
+                yield from _read_decompressed(gz_f, chunk_size, p_bar, f.tell)
 
     if p_bar is not None:
         p_bar.close()
@@ -1,10 +1,10 @@
+import html
 import itertools
 import os
 import pathlib
+import string
 
-import bs4
-
-INDEX_HTML = """
+INDEX_HTML = string.Template("""
 <!DOCTYPE html>
 <html lang="en">
   <head>
@@ -50,13 +50,14 @@ INDEX_HTML = """
         <p>This is the index for the wiki-categories site. See the 
         <a href="https://github.com/jon-edward/wiki-categories">GitHub repo</a> for its usage, file formats, 
         and creation.</p>
-        <b id="sub-path"></b>
+        <b id="sub-path">$sub_path</b>
         <ul id="sub-index">
+$entries
         </ul>
     </main>
   </body>
 </html>
-"""
+""")
 
 
 def generate_indices(path: pathlib.Path, root_path=pathlib.Path("/wiki-categories/")):
@@ -65,60 +66,55 @@ def generate_indices(path: pathlib.Path, root_path=pathlib.Path("/wiki-categorie
     files for navigation.
     """
     for subdir, dirs, files in os.walk(path):
-        with open(
-            pathlib.Path(subdir, "index.html"),
-            "wb",
-        ) as f:
-            index = bs4.BeautifulSoup(INDEX_HTML, "html.parser")
-
-            sub_index = index.find(id="sub-index")
+        with open(pathlib.Path(subdir, "index.html"), "w", encoding="utf-8") as f:
+            entries = []
 
             def format_dir(relative_d: pathlib.Path) -> str:
                 return f"/{relative_d}/" if str(relative_d) != "." else "root"
 
             def create_sub_path_entry(
-                sub_path: pathlib.Path, display_text: str = None, is_dir: bool = False
-            ):
+                sub_path: pathlib.Path,
+                display_text: str = None,
+                is_dir: bool = False,
+                class_name: str = None,
+            ) -> str:
                 p = root_path.joinpath(sub_path.relative_to(path))
 
-                li_tag = index.new_tag("li")
-                li_tag.attrs["class"] = "is-dir" if is_dir else "is-file"
-                a_tag = index.new_tag("a")
+                if class_name is None:
+                    class_name = "is-dir" if is_dir else "is-file"
 
                 href_content = str(p)
-
-                a_tag.attrs["href"] = href_content + (
-                    "/" if is_dir and href_content != "/" else ""
-                )
+                href = href_content + ("/" if is_dir and href_content != "/" else "")
 
                 if display_text is None:
-                    a_tag.append(p.name + ("/" if is_dir else ""))
-                else:
-                    a_tag.append(display_text)
-
-                li_tag.append(a_tag)
+                    display_text = p.name + ("/" if is_dir else "")
 
-                return li_tag
+                return (
+                    f'<li class="{class_name}">'
+                    f'<a href="{html.escape(href)}">{html.escape(display_text)}</a>'
+                    f"</li>"
+                )
 
             relative_path = format_dir(pathlib.Path(subdir).relative_to(path))
 
-            index.find(id="sub-path").append(f"Directory listing for {relative_path}:")
-
             try:
-                head_entry = create_sub_path_entry(
-                    pathlib.Path(subdir).parent, display_text="..", is_dir=True
+                entries.append(
+                    create_sub_path_entry(
+                        pathlib.Path(subdir).parent,
+                        display_text="..",
+                        is_dir=True,
+                        class_name="is-dir is-head-dir",
+                    )
                 )
-                head_entry.attrs["class"] += " is-head-dir"
-                sub_index.append(head_entry)
             except ValueError:
                 pass
 
             max_name_len = max(
-                len(x.split(".")[0]) for x in itertools.chain(files, dirs)
+                (len(x.partition(".")[0]) for x in itertools.chain(files, dirs)), default=0
             )
 
             def int_if_digits(path_segment: str):
-                name, *_ = path_segment.split(".")
+                name = path_segment.partition(".")[0]
                 if name.isdigit():
                     return f"{'0'*(max_name_len-len(name))}{name}"
                 return name.lower()
@@ -126,7 +122,7 @@ def generate_indices(path: pathlib.Path, root_path=pathlib.Path("/wiki-categorie
             dirs.sort(key=int_if_digits)
 
             for dir_ in dirs:
-                sub_index.append(
+                entries.append(
                     create_sub_path_entry(pathlib.Path(subdir, dir_), is_dir=True)
                 )
 
@@ -136,9 +132,14 @@ def generate_indices(path: pathlib.Path, root_path=pathlib.Path("/wiki-categorie
                 if file == "index.html":
                     continue
 
-                sub_index.append(create_sub_path_entry(pathlib.Path(subdir, file)))
+                entries.append(create_sub_path_entry(pathlib.Path(subdir, file)))
 
-            f.write(index.prettify(encoding="utf-8"))
+            f.write(
+                INDEX_HTML.substitute(
+                    sub_path=html.escape(f"Directory listing for {relative_path}:"),
+                    entries="\n".join(entries),
+                )
+            )
 
 
 if __name__ == "__main__":
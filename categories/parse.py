@@ -2,18 +2,67 @@
 Utilities for parsing SQL statements within a Wikipedia data dump file.
 """
 
-import ast
+import collections
 import dataclasses
+import multiprocessing
+import os
 import re
-from typing import Iterable
+from typing import Callable, Iterable, List, Optional, Tuple, Type, TypeVar
 
 
 _STRING_VALUE = r"'[^'\\]*(?:\\.[^'\\]*)*'"
 _INTEGER_VALUE = r"\d+"
 _FLOAT_VALUE = r"\d+\.\d+"
 
+# The patterns are ASCII and match the raw dump bytes, so only the matched
+# names need decoding.
+_CATEGORY_LINK_PATTERN = re.compile(
+    rf"\(({_INTEGER_VALUE}),({_STRING_VALUE}),(?:{_STRING_VALUE},){{4}}'(subcat|page)'\)".encode()
+)
+_PAGE_PATTERN = re.compile(
+    rf"\(({_INTEGER_VALUE}),14,"
+    rf"({_STRING_VALUE}),{_INTEGER_VALUE},"
+    rf"{_INTEGER_VALUE},{_FLOAT_VALUE},"
+    rf"{_STRING_VALUE},{_STRING_VALUE},"
+    rf"{_INTEGER_VALUE},{_INTEGER_VALUE},"
+    rf"{_STRING_VALUE},(?:{_STRING_VALUE}|NULL)\)".encode()
+)
+
+_PARALLEL_BLOCK_SIZE = 4 << 20
+
+_T = TypeVar("_T")
+
+# Escape sequences written by mysqldump; any other escaped byte stands for itself.
+_ESCAPE_PATTERN = re.compile(rb"\\(.)", re.DOTALL)
+_UNESCAPED = {
+    b"0": b"\0",
+    b"b": b"\b",
+    b"n": b"\n",
+    b"r": b"\r",
+    b"t": b"\t",
+    b"Z": b"\x1a",
+}
+
+
+def _unescape(match: re.Match) -> bytes:
+    escaped = match.group(1)
+    return _UNESCAPED.get(escaped, escaped)
+
+
+def _unquote(value: bytes) -> str:
+    """
+    Strip the quotes around an SQL string value, unescape and decode it.
+    """
+
+    value = value[1:-1]
+
+    if b"\\" in value:
+        value = _ESCAPE_PATTERN.sub(_unescape, value)
+
+    return value.decode("utf-8", errors="ignore")
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class CategoryLink:
     """
     A deserialized entry within a category links SQL script.
@@ -24,7 +73,7 @@ class CategoryLink:
     is_article: bool
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Page:
     """
     A deserialized entry within a pages SQL script.
@@ -41,16 +90,26 @@ def split_lines(buffered_content: Iterable[bytes]) -> Iterable[bytes]:
 
     sep = b"\n"
 
-    line_buffer = b""
+    # The dumps' INSERT lines can span many chunks, so the partial line is
+    # extended in place rather than rebuilt with every chunk.
+    line_buffer = bytearray()
 
     for content in buffered_content:
         lines = content.split(sep)
 
-        lines[0] = line_buffer + lines[0]
-        line_buffer = lines.pop()
+        if len(lines) == 1:
+            line_buffer += content
+            continue
+
+        if line_buffer:
+            line_buffer += lines[0]
+            lines[0] = bytes(line_buffer)
+            line_buffer.clear()
+
+        line_buffer += lines.pop()
         yield from lines
 
-    yield line_buffer
+    yield bytes(line_buffer)
 
 
 def parse_category_links(lines: Iterable[bytes]) -> Iterable[CategoryLink]:
@@ -58,19 +117,15 @@ def parse_category_links(lines: Iterable[bytes]) -> Iterable[CategoryLink]:
     Deserialize category link SQL script lines into CategoryLink objects.
     """
 
-    pattern: re.Pattern = re.compile(
-        rf"\(({_INTEGER_VALUE}),({_STRING_VALUE}),(?:{_STRING_VALUE},){{4}}'(subcat|page)'\)"
-    )
+    findall = _CATEGORY_LINK_PATTERN.findall
 
     for line in lines:
-        line_str = line.decode("utf-8", errors="ignore")
-
-        for hit in re.findall(pattern, line_str):
+        for hit in findall(line):
             child_id_str, unescaped_parent_name, page_or_subcat = hit
 
             child_id = int(child_id_str)
-            parent_name = ast.literal_eval(unescaped_parent_name)
-            is_article = page_or_subcat == "page"
+            parent_name = _unquote(unescaped_parent_name)
+            is_article = page_or_subcat == b"page"
 
             yield CategoryLink(child_id, parent_name, is_article)
 
@@ -80,18 +135,88 @@ def parse_pages(lines: Iterable[bytes]) -> Iterable[Page]:
     Deserialize pages SQL script lines into Page objects.
     """
 
-    pattern: re.Pattern = re.compile(
-        rf"\(({_INTEGER_VALUE}),14,"
-        rf"({_STRING_VALUE}),{_INTEGER_VALUE},"
-        rf"{_INTEGER_VALUE},{_FLOAT_VALUE},"
-        rf"{_STRING_VALUE},{_STRING_VALUE},"
-        rf"{_INTEGER_VALUE},{_INTEGER_VALUE},"
-        rf"{_STRING_VALUE},(?:{_STRING_VALUE}|NULL)\)"
-    )
+    findall = _PAGE_PATTERN.findall
 
     for line in lines:
-        line_str = line.decode("utf-8", errors="ignore")
-
-        for hit in re.findall(pattern, line_str):
+        for hit in findall(line):
             page_id_str, unescaped_name = hit
-            yield Page(int(page_id_str), ast.literal_eval(unescaped_name))
+            yield Page(int(page_id_str), _unquote(unescaped_name))
+
+
+def _split_blocks(
+    buffered_content: Iterable[bytes], block_size: int
+) -> Iterable[bytes]:
+    buffer = bytearray()
+
+    for content in buffered_content:
+        buffer += content
+
+        if len(buffer) >= block_size:
+            end = buffer.rfind(b"\n")
+            if end != -1:
+                yield bytes(buffer[:end])
+                del buffer[: end + 1]
+
+    yield bytes(buffer)
+
+
+def _parse_block(
+    parser: Callable[[Iterable[bytes]], Iterable[_T]], block: bytes
+) -> Tuple[Optional[Type[_T]], List[list]]:
+    rows = list(parser(block.split(b"\n")))
+
+    if not rows:
+        return None, []
+
+    # The rows are sent back as one list per field, which pickles many times
+    # faster than the dataclass instances themselves.
+    row_type = type(rows[0])
+    columns = [
+        [getattr(row, field.name) for row in rows]
+        for field in dataclasses.fields(row_type)
+    ]
+
+    return row_type, columns
+
+
+def _unpack_block(block: Tuple[Optional[Type[_T]], List[list]]) -> Iterable[_T]:
+    row_type, columns = block
+
+    if row_type is None:
+        return ()
+
+    return map(row_type, *columns)
+
+
+def parse_parallel(
+    buffered_content: Iterable[bytes],
+    parser: Callable[[Iterable[bytes]], Iterable[_T]],
+    processes: Optional[int] = None,
+) -> Iterable[_T]:
+    """
+    Equivalent to parser(split_lines(buffered_content)), but the content is
+    cut into blocks of whole lines that are parsed by a pool of processes.
+    Results keep the order of the content. The parser must yield dataclass
+    instances.
+    """
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes == 1:
+        yield from parser(split_lines(buffered_content))
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        # Blocks are submitted as results are consumed, so a fast decompressor
+        # can't queue up the whole dump in memory.
+        pending = collections.deque()
+
+        for block in _split_blocks(buffered_content, _PARALLEL_BLOCK_SIZE):
+            pending.append(pool.apply_async(_parse_block, (parser, block)))
+
+            if len(pending) > 2 * processes:
+                yield from _unpack_block(pending.popleft().get())
+
+        while pending:
+            yield from _unpack_block(pending.popleft().get())
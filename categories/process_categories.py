@@ -2,14 +2,15 @@
 Contains the main function entrypoint for categories.
 """
 
-from collections import defaultdict
+from array import array
+from collections import defaultdict, deque
 import dataclasses
 import datetime
 import logging
+import multiprocessing
 import os
 import pathlib
-import shutil
-import struct
+import sys
 from textwrap import dedent
 from typing import (
     Callable,
@@ -23,7 +24,6 @@ from typing import (
     Union,
 )
 
-import networkx as nx
 from tqdm import tqdm
 
 from parse import CategoryLink, Page
@@ -32,18 +32,32 @@ from parse import CategoryLink, Page
 _BALANCING_MOD_OPERAND = 2_000
 _DATETIME_STRFTIME = "%m/%d/%Y, %H:%M:%S"
 
-def _uint32_from_bytes(b: bytes) -> List[int]:
-    num_integers = len(b) // 4
-    return list(struct.unpack(f'>{num_integers}I', b))
-
 def _bytes_from_uint32(val: Iterable[int]) -> bytes:
-    return b''.join(struct.pack('>I', v) for v in val)
+    packed = array("I", val)
+    if sys.byteorder == "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _write_file(path: Union[str, pathlib.Path], data: bytes):
+    # One open, write and close per file, without a buffered file object.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
 
 
 def _serialize_fields(*fields: bytes) -> bytes:
-    return b"".join(
-        len(x).to_bytes(length=4) + x for x in fields
-    )
+    # Length prefixes and values are joined in one pass, so no field is
+    # copied into an intermediate prefix + value object first.
+    parts = []
+    for x in fields:
+        parts.append(len(x).to_bytes(length=4))
+        parts.append(x)
+    return b"".join(parts)
 
 
 def _serialize_category(
@@ -63,6 +77,143 @@ def _serialize_category(
     )
 
 
+# Set in each process that writes category bins, see _write_category_bin.
+_excluded_articles: Set[int] = set()
+
+
+def _init_bin_writer(excluded_articles: Set[int]):
+    global _excluded_articles
+    _excluded_articles = excluded_articles
+
+
+def _write_category_bin(
+    chunk_dir: pathlib.Path,
+    categories: List[Tuple[int, str, List[int], List[int], array]],
+) -> array:
+    """
+    Write the .category files and the dir_list.index of one bin, and return
+    the ids of the articles they list.
+    """
+
+    excluded_articles = _excluded_articles
+
+    chunk_dir.mkdir(exist_ok=True)
+    # Building a Path per file costs more than the write itself.
+    chunk_dir_str = os.fspath(chunk_dir)
+    added_articles = set()
+
+    for category, name, predecessors, successors, category_articles in categories:
+        articles = [a for a in category_articles if a not in excluded_articles]
+        added_articles.update(articles)
+
+        _write_file(
+            os.path.join(chunk_dir_str, f"{category}.category"),
+            _serialize_category(name, predecessors, successors, articles),
+        )
+
+    _write_file(
+        chunk_dir.joinpath("dir_list.index"),
+        _bytes_from_uint32(sorted(category for category, *_ in categories)),
+    )
+
+    return array("I", added_articles)
+
+
+def _group_by(keys: array, values: array, n: int) -> Tuple[array, array]:
+    """
+    Group values by their key in 0..n-1, in CSR form: the values of key k are
+    indices[indptr[k]:indptr[k + 1]], in their original order.
+    """
+
+    indptr = array("I", [0]) * (n + 1)
+    for k in keys:
+        indptr[k + 1] += 1
+    for k in range(n):
+        indptr[k + 1] += indptr[k]
+
+    indices = array("I", [0]) * len(values)
+    fill = indptr[:-1]
+    for k, v in zip(keys, values):
+        indices[fill[k]] = v
+        fill[k] += 1
+
+    return indptr, indices
+
+
+class _CategoryGraph:
+    """
+    A directed graph of category ids, stored as compressed adjacency arrays.
+    It mirrors the parts of networkx.DiGraph used here, including node and
+    neighbor order, at a fraction of the memory.
+    """
+
+    def __init__(self, sources: array, targets: array):
+        index: Dict[int, int] = {}
+        self._nodes = array("I")
+
+        def dense(node: int) -> int:
+            i = index.get(node)
+            if i is None:
+                i = index[node] = len(self._nodes)
+                self._nodes.append(node)
+            return i
+
+        dense_sources = array("I")
+        dense_targets = array("I")
+
+        for u, v in zip(sources, targets):
+            dense_sources.append(dense(u))
+            dense_targets.append(dense(v))
+
+        n = len(self._nodes)
+
+        self._index = index
+        self._removed = bytearray(n)
+        self._len = n
+        self._succ = _group_by(dense_sources, dense_targets, n)
+        self._pred = _group_by(dense_targets, dense_sources, n)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, node: int) -> bool:
+        i = self._index.get(node)
+        return i is not None and not self._removed[i]
+
+    def __iter__(self) -> Iterable[int]:
+        removed = self._removed
+        return (node for i, node in enumerate(self._nodes) if not removed[i])
+
+    def _neighbors(self, adjacency: Tuple[array, array], node: int) -> List[int]:
+        i = self._index.get(node)
+        if i is None or self._removed[i]:
+            return []
+
+        indptr, indices = adjacency
+        removed = self._removed
+        nodes = self._nodes
+
+        # dict.fromkeys drops repeated edges, keeping the first.
+        return [
+            nodes[j]
+            for j in dict.fromkeys(indices[indptr[i] : indptr[i + 1]])
+            if not removed[j]
+        ]
+
+    def successors(self, node: int) -> List[int]:
+        return self._neighbors(self._succ, node)
+
+    def predecessors(self, node: int) -> List[int]:
+        return self._neighbors(self._pred, node)
+
+    def remove_nodes_from(self, nodes: Iterable[int]):
+        for node in nodes:
+            i = self._index.get(node)
+            if i is not None and not self._removed[i]:
+                self._removed[i] = 1
+                self._len -= 1
+
+
 @dataclasses.dataclass
 class CategoriesInfo:
     """
@@ -92,9 +243,13 @@ def process_categories(
     excluded_parents: Optional[Iterable[int]] = None,
     excluded_article_categories: Optional[Iterable[int]] = None,
     progress: bool = True,
+    processes: Optional[int] = None,
 ) -> CategoriesInfo:
     """
     Main function of categories and used in CLI. See README.md for behavior.
+
+    The category bins are written by a pool of processes, by default one per
+    CPU.
     """
 
     if excluded_parents is None:
@@ -103,33 +258,21 @@ def process_categories(
     if excluded_article_categories is None:
         excluded_article_categories = ()
 
-    articles_dir = dest.joinpath("articles")
-    os.makedirs(articles_dir, exist_ok=True)
-
     id_to_name: Dict[int, str] = {}
 
     for page in pages_gen():
         id_to_name[page.page_id] = page.name
 
-    name_to_id = {v: k for k, v in id_to_name.items()}
-
-    category_edges: List[Tuple[int, int]] = []
-
-    article_acc: DefaultDict[int, List[int]] = defaultdict(list)
-    max_items = 100
-
-    def push_article_list(category_id, _article_list, clear: bool = True):
-        with articles_dir.joinpath(f"{category_id}.articles").open("ab") as f:
-            f.write(b"".join(article.to_bytes(length=4) for article in _article_list))
-        if clear:
-            _article_list.clear()
+    name_to_id = dict(zip(id_to_name.values(), id_to_name.keys()))
 
-    def append_id(category_id: int, article_id: int):
-        _article_list = article_acc[category_id]
-        _article_list.append(article_id)
+    edge_parents = array("I")
+    edge_children = array("I")
 
-        if len(_article_list) > max_items:
-            push_article_list(category_id, _article_list)
+    # Article links are kept as packed uint32 pairs; their categories are
+    # mapped to dense indices so the links can be grouped afterwards.
+    article_index: Dict[int, int] = {}
+    article_categories = array("I")
+    article_ids = array("I")
 
     for category_link in category_links_gen():
         parent_id = name_to_id.get(category_link.parent_name, None)
@@ -138,33 +281,36 @@ def process_categories(
             continue
 
         if category_link.is_article:
-            append_id(parent_id, category_link.child_id)
+            article_categories.append(
+                article_index.setdefault(parent_id, len(article_index))
+            )
+            article_ids.append(category_link.child_id)
         elif category_link.child_id in id_to_name:
-            category_edges.append((parent_id, category_link.child_id))
+            edge_parents.append(parent_id)
+            edge_children.append(category_link.child_id)
 
     del name_to_id
 
-    for k, article_list in article_acc.items():
-        if not article_list:
-            continue
-        push_article_list(k, article_list, clear=False)
+    articles_indptr, articles = _group_by(
+        article_categories, article_ids, len(article_index)
+    )
+    del article_categories, article_ids
 
-    del article_acc
+    def read_article_list(category_id: int) -> array:
+        i = article_index.get(category_id)
+        if i is None:
+            return array("I")
+        return articles[articles_indptr[i] : articles_indptr[i + 1]]
 
-    cat_graph = nx.DiGraph()
-    cat_graph.add_edges_from(category_edges)
-
-    def read_article_list(category_id: int) -> Iterable[int]:
-        try:
-            return _uint32_from_bytes(
-                articles_dir.joinpath(f"{category_id}.articles").read_bytes(),
-            )
-        except FileNotFoundError:
-            return []
+    cat_graph = _CategoryGraph(edge_parents, edge_children)
+    del edge_parents, edge_children
 
     excluded_categories = set()
 
     for e in excluded_parents:
+        if e not in cat_graph:
+            logging.warning("Excluded parent category %d is not in the graph.", e)
+            continue
         excluded_categories.update(cat_graph.successors(e))
 
     excluded_articles = set()
@@ -190,53 +336,71 @@ def process_categories(
     if progress:
         p_bar = tqdm(total=len(cat_graph))
 
-    added_articles: Set[int] = set()
+    bins: DefaultDict[int, List[int]] = defaultdict(list)
 
     for category in cat_graph:
+        bins[category % _BALANCING_MOD_OPERAND].append(category)
+
+    def bin_tasks() -> Iterable[Tuple[pathlib.Path, list]]:
+        for bin_id, categories in bins.items():
+            yield dest.joinpath(str(bin_id)), [
+                (
+                    category,
+                    id_to_name[category],
+                    cat_graph.predecessors(category),
+                    cat_graph.successors(category),
+                    read_article_list(category),
+                )
+                for category in categories
+            ]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
 
-        name = id_to_name[category]
-        predecessors = cat_graph.predecessors(category)
-        successors = cat_graph.successors(category)
-
-        category_chunk_dir = dest.joinpath(str(category % _BALANCING_MOD_OPERAND))
-        category_chunk_dir.mkdir(exist_ok=True)
-
-        articles = [
-            a for a in read_article_list(category) if a not in excluded_articles
-        ]
-        added_articles.update(articles)
-
-        category_chunk_dir.joinpath(f"{category}.category").write_bytes(
-            _serialize_category(name, predecessors, successors, articles)
-        )
+    added_articles: Set[int] = set()
 
+    def add_bin_result(categories: list, bin_articles: array):
+        added_articles.update(bin_articles)
         if p_bar is not None:
-            p_bar.update(1)
-
-    def dir_list_content(path: pathlib.Path) -> bytes:
-        acc = []
-        for b in os.listdir(path):
-            s = b.split(".")[0]
-            if not s.isdigit():
-                continue
-            acc.append(int(s))
-        return _bytes_from_uint32(acc)
-
-    dest.joinpath("dir_list.index").write_bytes(dir_list_content(dest))
-
-    for container in os.listdir(dest):
-        container_path = dest.joinpath(container)
-        if not container_path.is_dir():
-            continue
-        container_path.joinpath("dir_list.index").write_bytes(
-            dir_list_content(container_path)
-        )
+            p_bar.update(len(categories))
+
+    if processes == 1:
+        _init_bin_writer(excluded_articles)
+
+        for chunk_dir, categories in bin_tasks():
+            add_bin_result(categories, _write_category_bin(chunk_dir, categories))
+    else:
+        with multiprocessing.Pool(
+            processes, _init_bin_writer, (excluded_articles,)
+        ) as pool:
+            # Bins are submitted as results come back, so only a few bins'
+            # worth of graph data is copied out at a time.
+            pending = deque()
+
+            for chunk_dir, categories in bin_tasks():
+                pending.append(
+                    (
+                        categories,
+                        pool.apply_async(_write_category_bin, (chunk_dir, categories)),
+                    )
+                )
+
+                if len(pending) > 2 * processes:
+                    categories, result = pending.popleft()
+                    add_bin_result(categories, result.get())
+
+            while pending:
+                categories, result = pending.popleft()
+                add_bin_result(categories, result.get())
+
+    # The bins' ids are known here, so the indices need no directory scans.
+    _write_file(dest.joinpath("dir_list.index"), _bytes_from_uint32(sorted(bins)))
+
+    del bins
 
     if p_bar is not None:
         p_bar.close()
 
-    shutil.rmtree(articles_dir)
-
     categories_count = len(cat_graph)
     articles_count = len(added_articles)
     finished = datetime.datetime.now()